@@ -40,9 +40,9 @@ run_url_service_tests() {
     # Check if pytest is available
     if ! command -v pytest &> /dev/null; then
         log_warning "pytest not found, trying with python -m pytest"
-        python -m pytest tests/ -v --cov=app --cov-report=html --cov-report=term-missing
+        python -m pytest tests/ -v -n auto --dist loadgroup --cov=app --cov-report=html --cov-report=term-missing
     else
-        pytest tests/ -v --cov=app --cov-report=html --cov-report=term-missing
+        pytest tests/ -v -n auto --dist loadgroup --cov=app --cov-report=html --cov-report=term-missing
     fi
 
     log_success "URL Service tests completed"
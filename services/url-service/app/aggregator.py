@@ -1,14 +1,76 @@
 """Aggregator for fetching data from other services."""
 import logging
+import time
 from typing import Optional
 
 import httpx
+import orjson
 
 from app.config import get_settings
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client so service-to-service calls reuse pooled connections
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared HTTP client."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(3.0, connect=1.0),
+            limits=httpx.Limits(max_keepalive_connections=100, keepalive_expiry=30),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client."""
+    global _http_client
+    if _http_client:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    calls are skipped for ``reset_timeout`` seconds. After that, calls are
+    let through again; one success closes the breaker, another failure
+    re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Return True if a call should be attempted."""
+        if self._opened_at is None:
+            return True
+        return time.monotonic() - self._opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+
+
+# One breaker per Analytics endpoint so a stalled service can't add its
+# timeout to every get_url_info or redirect
+_click_count_breaker = CircuitBreaker()
+_track_click_breaker = CircuitBreaker()
+
 
 async def get_click_count(short_code: str) -> int:
     """
@@ -20,20 +82,31 @@ async def get_click_count(short_code: str) -> int:
     Returns:
         Total click count, or 0 if fetch fails
     """
+    if not _click_count_breaker.allow():
+        logger.debug(f"Analytics circuit open, skipping click count for {short_code}")
+        return 0
+
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(
-                f"{settings.analytics_service_url}/api/analytics/{short_code}",
-                headers={"X-Internal-API-Key": settings.internal_api_key},
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("totalClicks", 0)
-            logger.warning(f"Analytics service returned {response.status_code} for {short_code}")
+        response = await get_http_client().get(
+            f"{settings.analytics_service_url}/api/analytics/{short_code}",
+            headers={"X-Internal-API-Key": settings.internal_api_key},
+            timeout=httpx.Timeout(5.0, connect=1.0),
+        )
+        if response.status_code == 200:
+            _click_count_breaker.record_success()
+            data = orjson.loads(response.content)
+            return data.get("totalClicks", 0)
+        logger.warning(f"Analytics service returned {response.status_code} for {short_code}")
+        if response.status_code >= 500:
+            _click_count_breaker.record_failure()
+        else:
+            _click_count_breaker.record_success()
     except httpx.TimeoutException:
         logger.warning(f"Timeout fetching click count for {short_code}")
+        _click_count_breaker.record_failure()
     except Exception as e:
         logger.warning(f"Error fetching click count for {short_code}: {e}")
+        _click_count_breaker.record_failure()
 
     return 0
 
@@ -49,23 +122,36 @@ async def track_click(short_code: str, original_url: str) -> bool:
     Returns:
         True if tracking succeeded, False otherwise
     """
+    if not _track_click_breaker.allow():
+        logger.debug(f"Analytics circuit open, skipping click tracking for {short_code}")
+        return False
+
     try:
-        async with httpx.AsyncClient(timeout=3.0) as client:
-            response = await client.post(
-                f"{settings.analytics_service_url}/api/analytics/track",
-                json={
-                    "short_code": short_code,
-                    "original_url": original_url,
-                },
-                headers={"X-Internal-API-Key": settings.internal_api_key},
-            )
-            if response.status_code == 201:
-                logger.debug(f"Click tracked for {short_code}")
-                return True
-            logger.warning(f"Analytics tracking returned {response.status_code}")
+        response = await get_http_client().post(
+            f"{settings.analytics_service_url}/api/analytics/track",
+            content=orjson.dumps({
+                "short_code": short_code,
+                "original_url": original_url,
+            }),
+            headers={
+                "Content-Type": "application/json",
+                "X-Internal-API-Key": settings.internal_api_key,
+            },
+        )
+        if response.status_code == 201:
+            _track_click_breaker.record_success()
+            logger.debug(f"Click tracked for {short_code}")
+            return True
+        logger.warning(f"Analytics tracking returned {response.status_code}")
+        if response.status_code >= 500:
+            _track_click_breaker.record_failure()
+        else:
+            _track_click_breaker.record_success()
     except httpx.TimeoutException:
         logger.warning(f"Timeout tracking click for {short_code}")
+        _track_click_breaker.record_failure()
     except Exception as e:
         logger.error(f"Error tracking click for {short_code}: {e}")
+        _track_click_breaker.record_failure()
 
     return False
@@ -1,7 +1,14 @@
 """Authentication and authorization for URL service."""
+import base64
+import binascii
+import hashlib
+import hmac
+import time
 from typing import Optional
 
 import jwt
+import orjson
+from cachetools import TTLCache
 from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -11,6 +18,16 @@ from app.config import get_settings
 settings = get_settings()
 security = HTTPBearer(auto_error=False)
 
+# Verified tokens, keyed by SHA-256 of the raw token so tokens aren't retained
+_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=60)
+
+# Rejected tokens map to their 401 detail; kept briefly so a client retrying
+# a bad token doesn't cost a verification each time
+_rejected_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=5)
+
+# HMAC keyed with the secret once; each verification works on a copy
+_hmac_template = hmac.new(settings.jwt_secret.encode(), digestmod=hashlib.sha256)
+
 
 class TokenData(BaseModel):
     """Decoded JWT token data."""
@@ -23,36 +40,120 @@ class OptionalUser(BaseModel):
     is_authenticated: bool = False
 
 
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _verify_hs256(token: str) -> dict:
+    """
+    Verify an HS256 JWT and return its payload.
+
+    Mirrors ``jwt.decode(token, secret, algorithms=["HS256"])`` without
+    PyJWT's generic overhead, with one deliberate difference: exp, nbf and
+    iat must be JSON numbers as RFC 7519 requires, so numeric strings such
+    as ``"1792067433"`` (which PyJWT coerces) are rejected. The user service
+    always issues numeric claims. Like ``jwt.decode`` with no audience
+    configured, any token carrying an ``aud`` claim is rejected.
+
+    Raises:
+        jwt.ExpiredSignatureError: If the token has expired.
+        jwt.InvalidTokenError: For any other verification failure.
+    """
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = orjson.loads(_b64url_decode(header_segment))
+        signature = _b64url_decode(signature_segment)
+    except (ValueError, binascii.Error, orjson.JSONDecodeError):
+        raise jwt.InvalidTokenError("Malformed token")
+
+    if not isinstance(header, dict) or header.get("alg") != "HS256":
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+    mac = _hmac_template.copy()
+    mac.update(f"{header_segment}.{payload_segment}".encode())
+    if not hmac.compare_digest(mac.digest(), signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+
+    try:
+        payload = orjson.loads(_b64url_decode(payload_segment))
+    except (ValueError, binascii.Error, orjson.JSONDecodeError):
+        raise jwt.DecodeError("Invalid payload")
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid payload")
+
+    # We accept no audience, so a token minted for any audience is refused
+    if payload.get("aud"):
+        raise jwt.InvalidAudienceError("Invalid audience")
+
+    now = time.time()
+    for claim in ("exp", "nbf", "iat"):
+        value = payload.get(claim)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise jwt.DecodeError(f"{claim} claim must be a number")
+    if "exp" in payload and payload["exp"] <= now:
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    if "nbf" in payload and payload["nbf"] > now:
+        raise jwt.ImmatureSignatureError("The token is not yet valid (nbf)")
+    if "iat" in payload and payload["iat"] > now:
+        raise jwt.ImmatureSignatureError("The token is not yet valid (iat)")
+    return payload
+
+
 def decode_token(token: str) -> TokenData:
     """
     Decode and validate JWT token.
 
+    Successfully verified tokens are cached for up to a minute (never past
+    their own expiry), so repeat requests skip signature verification.
+    Rejected tokens are remembered for a few seconds for the same reason.
+
     Raises:
         HTTPException: If token is invalid or expired.
     """
-    try:
-        payload = jwt.decode(
-            token,
-            settings.jwt_secret,
-            algorithms=["HS256"]
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        token_data, expires_at = cached
+        if expires_at is None or time.time() < expires_at:
+            return token_data
+        _token_cache.pop(key, None)
+
+    rejected = _rejected_token_cache.get(key)
+    if rejected is not None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=rejected,
         )
+
+    try:
+        payload = _verify_hs256(token)
         user_id = payload.get("userId")
         if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token payload",
             )
-        return TokenData(user_id=str(user_id))
     except jwt.ExpiredSignatureError:
+        _rejected_token_cache[key] = "Token has expired"
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token has expired",
         )
     except jwt.InvalidTokenError:
+        _rejected_token_cache[key] = "Invalid token"
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+    except HTTPException as e:
+        _rejected_token_cache[key] = e.detail
+        raise
+
+    token_data = TokenData(user_id=str(user_id))
+    expires_at = payload.get("exp")
+    if expires_at is None or expires_at > time.time():
+        _token_cache[key] = (token_data, expires_at)
+    return token_data
 
 
 async def get_current_user(
@@ -1,9 +1,13 @@
 """Redis caching layer for URL lookups."""
-import json
+import asyncio
 import logging
-from typing import Optional
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
 
+import orjson
 import redis.asyncio as redis
+from cachetools import TTLCache
 
 from app.config import get_settings
 from app.metrics import cache_hits_total, cache_misses_total
@@ -14,15 +18,83 @@ logger = logging.getLogger(__name__)
 # Redis client singleton
 _redis_client: Optional[redis.Redis] = None
 
+# Per-worker cache in front of Redis for hot short codes. Entries hold
+# (data, deadline) so they never outlive the Redis key they were read from.
+LOCAL_CACHE_TTL = 30
+_local_cache: TTLCache = TTLCache(maxsize=8192, ttl=LOCAL_CACHE_TTL)
 
-async def get_redis() -> redis.Redis:
-    """Get or create Redis client."""
+
+def _cache_locally(short_code: str, data: dict, ttl: float):
+    """Store URL data in the per-worker cache for at most ``ttl`` seconds."""
+    ttl = min(LOCAL_CACHE_TTL, ttl)
+    if ttl > 0:
+        _local_cache[short_code] = (data, time.monotonic() + ttl)
+
+
+def _url_key(short_code: str) -> str:
+    """
+    Redis key for a short code's URL data.
+
+    Versioned with the payload format, so entries written in an older
+    format are never read back.
+    """
+    return f"url:v2:{short_code}"
+
+
+# In-flight lookups, so concurrent misses for the same key share one query
+_inflight: dict[str, asyncio.Future] = {}
+
+
+async def singleflight(key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run ``fetch`` once for concurrent callers with the same key.
+
+    The first caller runs ``fetch``; callers arriving while it is in flight
+    await the same result (or exception) instead of repeating the work.
+    If the first caller is cancelled, waiting callers retry rather than
+    inheriting its cancellation.
+    """
+    while (future := _inflight.get(key)) is not None:
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Only swallow the leader's cancellation, never our own
+            if not future.cancelled() or asyncio.current_task().cancelling():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await fetch()
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited future doesn't log a warning
+            future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        _inflight.pop(key, None)
+
+
+def get_redis() -> redis.Redis:
+    """
+    Get or create Redis client.
+
+    Creating the client does not open a connection, so this is a plain
+    function rather than a coroutine and is safe to call on the hot path.
+    """
     global _redis_client
     if _redis_client is None:
         _redis_client = redis.from_url(
             settings.redis_url,
             encoding="utf-8",
-            decode_responses=True,
+            # Payloads are orjson bytes, so skip the UTF-8 decode on read
+            decode_responses=False,
         )
     return _redis_client
 
@@ -40,15 +112,30 @@ async def get_cached_url(short_code: str) -> Optional[dict]:
     Get URL data from cache.
 
     Returns:
-        dict with 'original_url' and optionally 'expires_at', or None if not cached.
+        dict with 'original_url' and optionally 'exp_ts' (expiry as epoch
+        seconds), or None if not cached.
     """
+    local = _local_cache.get(short_code)
+    if local is not None:
+        data, deadline = local
+        if time.monotonic() < deadline:
+            cache_hits_total.inc()
+            return data
+        _local_cache.pop(short_code, None)
+
+    key = _url_key(short_code)
     try:
-        client = await get_redis()
-        data = await client.get(f"url:{short_code}")
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            data, pttl = await pipe.execute()
         if data:
-            logger.debug(f"Cache HIT for {short_code}")
+            logger.debug(f"Cache HIT for {short_code} (ttl {pttl}ms)")
             cache_hits_total.inc()
-            return json.loads(data)
+            data = orjson.loads(data)
+            # PTTL is -1 for keys without an expiry
+            _cache_locally(short_code, data, LOCAL_CACHE_TTL if pttl < 0 else pttl / 1000)
+            return data
         logger.debug(f"Cache MISS for {short_code}")
         cache_misses_total.inc()
         return None
@@ -57,38 +144,92 @@ async def get_cached_url(short_code: str) -> Optional[dict]:
         return None
 
 
-async def cache_url(short_code: str, original_url: str, expires_at: Optional[str] = None, ttl: int = 3600):
+async def cache_url(short_code: str, original_url: str, expires_at: Optional[datetime] = None, ttl: int = 3600):
     """
     Cache URL data.
 
     Args:
         short_code: The short URL code
         original_url: The destination URL
-        expires_at: Optional expiration datetime (ISO format string)
+        expires_at: Optional expiration datetime (naive UTC)
         ttl: Cache TTL in seconds (default 1 hour)
     """
     try:
-        client = await get_redis()
         data = {"original_url": original_url}
         if expires_at:
-            data["expires_at"] = expires_at
+            data["exp_ts"] = int(expires_at.replace(tzinfo=timezone.utc).timestamp())
 
-        await client.setex(
-            f"url:{short_code}",
+        await get_redis().setex(
+            _url_key(short_code),
             ttl,
-            json.dumps(data),
+            orjson.dumps(data),
         )
+        _cache_locally(short_code, data, ttl)
         logger.debug(f"Cached URL {short_code} with TTL {ttl}s")
     except Exception as e:
         logger.warning(f"Redis error on set: {e}")
 
 
+async def get_cached_qr(short_code: str, size: int) -> Optional[bytes]:
+    """Get a rendered QR code PNG from cache, or None if not cached."""
+    try:
+        return await get_redis().hget(f"qr:{short_code}", size)
+    except Exception as e:
+        logger.warning(f"Redis error on QR get: {e}")
+        return None
+
+
+async def cache_qr(
+    short_code: str,
+    size: int,
+    png: bytes,
+    expires_at: Optional[datetime] = None,
+    ttl: int = 86400,
+):
+    """
+    Cache a rendered QR code PNG.
+
+    All sizes for a short code share one hash so invalidate_url can drop
+    them together.
+
+    Args:
+        short_code: The short URL code
+        size: Image size in pixels
+        png: Encoded PNG bytes
+        expires_at: Optional URL expiration (naive UTC); caps the TTL
+        ttl: Cache TTL in seconds (default 1 day)
+    """
+    if expires_at:
+        remaining = expires_at.replace(tzinfo=timezone.utc).timestamp() - time.time()
+        ttl = min(ttl, int(remaining))
+        if ttl <= 0:
+            return
+    key = f"qr:{short_code}"
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hset(key, size, png)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis error on QR set: {e}")
+
+
 async def invalidate_url(short_code: str):
-    """Remove URL from cache."""
+    """Remove URL and its QR codes from cache."""
+    await invalidate_urls([short_code])
+
+
+async def invalidate_urls(short_codes: list[str]):
+    """Remove several URLs and their QR codes from cache in one round-trip."""
+    if not short_codes:
+        return
+    keys = []
+    for short_code in short_codes:
+        _local_cache.pop(short_code, None)
+        keys.extend((_url_key(short_code), f"qr:{short_code}"))
     try:
-        client = await get_redis()
-        await client.delete(f"url:{short_code}")
-        logger.debug(f"Invalidated cache for {short_code}")
+        await get_redis().delete(*keys)
+        logger.debug(f"Invalidated cache for {len(short_codes)} URL(s)")
     except Exception as e:
         logger.warning(f"Redis error on delete: {e}")
 
@@ -96,8 +237,7 @@ async def invalidate_url(short_code: str):
 async def cache_health_check() -> bool:
     """Check if Redis is healthy."""
     try:
-        client = await get_redis()
-        await client.ping()
+        await get_redis().ping()
         return True
     except Exception:
         return False
@@ -9,6 +9,11 @@ engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
     pool_pre_ping=True,
+    # Compiled SQL cache shared by all connections (SQLAlchemy default is 500)
+    query_cache_size=1200,
+    # Per-connection cache of server-side prepared statements used by the
+    # asyncpg dialect, so hot lookups skip parse/plan (default is 100)
+    connect_args={"prepared_statement_cache_size": 1024},
 )
 
 AsyncSessionLocal = async_sessionmaker(
@@ -1,10 +1,13 @@
 """URL Shortener Service - Main Application."""
+import gzip
 import logging
+import time
 from contextlib import asynccontextmanager
+from typing import Optional
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -12,7 +15,8 @@ from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from fastapi.responses import Response
 
-from app.cache import close_redis
+from app.aggregator import close_http_client
+from app.cache import close_redis, get_redis
 from app.config import get_settings
 from app.database import init_db
 from app.routes import router
@@ -36,10 +40,14 @@ async def lifespan(app: FastAPI):
     logger.info("Starting URL Shortener Service...")
     await init_db()
     logger.info("Database initialized")
+    get_redis()
+    logger.info("Redis client initialized")
     yield
     logger.info("Shutting down URL Shortener Service...")
     await close_redis()
     logger.info("Redis connection closed")
+    await close_http_client()
+    logger.info("HTTP client closed")
 
 
 app = FastAPI(
@@ -47,6 +55,7 @@ app = FastAPI(
     description="A microservice for creating and managing short URLs",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Add rate limiter to app state
@@ -74,10 +83,54 @@ async def global_exception_handler(request: Request, exc: Exception):
 
 # Prometheus metrics endpoint - must be defined BEFORE including router
 # to avoid being caught by the /{short_code} catch-all route
+# Encoded metrics are reused for scrapes within this many seconds
+METRICS_CACHE_SECONDS = 1.0
+# (generated_at, body, gzipped body or None until first requested)
+_metrics_cache: tuple[float, bytes, Optional[bytes]] = (0.0, b"", None)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q=0."""
+    qvalues = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[name.strip().lower()] = q
+    return qvalues.get("gzip", qvalues.get("*", 0.0)) > 0
+
+
 @app.get("/metrics", tags=["Monitoring"], include_in_schema=True)
-async def metrics():
+async def metrics(request: Request):
     """Prometheus metrics endpoint."""
-    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    global _metrics_cache
+    now = time.monotonic()
+    generated_at, body, gzipped = _metrics_cache
+    if not body or now - generated_at > METRICS_CACHE_SECONDS:
+        generated_at, body, gzipped = now, generate_latest(), None
+        _metrics_cache = (generated_at, body, gzipped)
+
+    if not _accepts_gzip(request.headers.get("accept-encoding", "")):
+        return Response(
+            content=body,
+            media_type=CONTENT_TYPE_LATEST,
+            headers={"Vary": "Accept-Encoding"},
+        )
+
+    if gzipped is None:
+        gzipped = gzip.compress(body, compresslevel=6)
+        _metrics_cache = (generated_at, body, gzipped)
+    return Response(
+        content=gzipped,
+        media_type=CONTENT_TYPE_LATEST,
+        headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+    )
 
 # Prometheus instrumentation - instruments all requests
 instrumentator = Instrumentator(
@@ -102,4 +155,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=settings.debug,
+        loop="uvloop",
+        http="httptools",
     )
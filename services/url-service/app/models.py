@@ -11,6 +11,10 @@ from app.database import Base
 
 class URL(Base):
     __tablename__ = "urls"
+    # All current defaults are client-side, so this has no effect today; it
+    # guards any future server_default, which would then be fetched with
+    # INSERT ... RETURNING instead of a follow-up SELECT
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
@@ -7,13 +7,23 @@ from typing import Optional
 
 import qrcode
 from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, status
-from fastapi.responses import RedirectResponse, StreamingResponse
-from sqlalchemy import select, update
+from fastapi.responses import Response
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.aggregator import get_click_count, track_click
 from app.auth import get_current_user, get_optional_user, OptionalUser, TokenData
-from app.cache import cache_url, get_cached_url, invalidate_url, cache_health_check
+from app.cache import (
+    cache_health_check,
+    cache_qr,
+    cache_url,
+    get_cached_qr,
+    get_cached_url,
+    invalidate_url,
+    invalidate_urls,
+    singleflight,
+)
 from app.config import get_settings
 from app.database import get_db
 from app.models import URL
@@ -40,6 +50,85 @@ router = APIRouter()
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Generated codes are retried on collision up to this many times
+MAX_SHORT_CODE_ATTEMPTS = 5
+
+SHORT_URL_PREFIX = f"{settings.base_url}/s/"
+
+# Label children bound once so hot paths skip the labels() lookup
+_URLS_CREATED = urls_created_total.labels(status="success")
+_LOOKUP_CACHE = url_lookups_total.labels(source="cache")
+_LOOKUP_DB = url_lookups_total.labels(source="database")
+_REDIRECT_SUCCESS = redirects_total.labels(status="success")
+_REDIRECT_NOT_FOUND = redirects_total.labels(status="not_found")
+_REDIRECT_EXPIRED = redirects_total.labels(status="expired")
+
+
+# Lookup statements are built once and executed with bound parameters, so
+# requests skip statement construction and always hit the compiled cache.
+# "now" is bound per call from datetime.utcnow() since expires_at is naive UTC.
+_NOT_EXPIRED = or_(URL.expires_at.is_(None), URL.expires_at > bindparam("now"))
+_URL_BY_CODE = select(URL).where(URL.short_code == bindparam("short_code"), _NOT_EXPIRED)
+_REDIRECT_TARGET_BY_CODE = (
+    select(URL.original_url, URL.expires_at)
+    .where(URL.short_code == bindparam("short_code"), _NOT_EXPIRED)
+)
+_EXPIRY_BY_CODE = (
+    select(URL.expires_at)
+    .where(URL.short_code == bindparam("short_code"), _NOT_EXPIRED)
+)
+
+
+def _lookup_params(short_code: str) -> dict:
+    return {"short_code": short_code, "now": datetime.utcnow()}
+
+
+async def _load_url(db: AsyncSession, short_code: str) -> Optional[URL]:
+    """
+    Load an active (non-expired) URL by short code.
+
+    The query is shared between concurrent callers for the same code.
+    """
+    async def fetch():
+        result = await db.execute(_URL_BY_CODE, _lookup_params(short_code))
+        return result.scalar_one_or_none()
+
+    return await singleflight(f"url:{short_code}", fetch)
+
+
+async def _load_redirect_target(db: AsyncSession, short_code: str):
+    """
+    Load only the columns a redirect needs for an active URL.
+
+    Returns a row with ``original_url`` and ``expires_at``, or None.
+    """
+    async def fetch():
+        result = await db.execute(_REDIRECT_TARGET_BY_CODE, _lookup_params(short_code))
+        return result.one_or_none()
+
+    return await singleflight(f"redirect:{short_code}", fetch)
+
+
+async def _missing_url_error(db: AsyncSession, short_code: str) -> HTTPException:
+    """
+    Build the error for a short code with no active URL.
+
+    Only runs after the main lookup came back empty, to tell an expired
+    URL (410) apart from one that doesn't exist (404).
+    """
+    result = await db.execute(
+        select(URL.expires_at).where(URL.short_code == short_code)
+    )
+    if result.scalar_one_or_none() is not None:
+        return HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="This short URL has expired.",
+        )
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Short URL not found.",
+    )
+
 
 @router.get("/health", response_model=HealthResponse, tags=["Health"])
 async def health_check():
@@ -68,66 +157,67 @@ async def create_short_url(
     - Guests: URL is associated with a claim token for later claiming
     """
     
-    if url_data.custom_code:
-        if not is_valid_short_code(url_data.custom_code):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid custom code. Must be 3-10 alphanumeric characters.",
-            )
-        existing = await db.execute(
-            select(URL).where(URL.short_code == url_data.custom_code)
+    if url_data.custom_code and not is_valid_short_code(url_data.custom_code):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid custom code. Must be 3-10 alphanumeric characters.",
         )
-        if existing.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Custom code already exists.",
-            )
-        short_code = url_data.custom_code
-    else:
-        # Generate unique short code
-        short_code = generate_short_code()
-        while True:
-            existing = await db.execute(
-                select(URL).where(URL.short_code == short_code)
-            )
-            if not existing.scalar_one_or_none():
-                break
-            short_code = generate_short_code()
 
     # Calculate expiration if specified
     expires_at = None
     if url_data.expires_in_days:
         expires_at = datetime.utcnow() + timedelta(days=url_data.expires_in_days)
 
-    # Create URL record
-    url = URL(
-        short_code=short_code,
-        original_url=str(url_data.original_url),
-        user_id=user.user_id if user.is_authenticated else None,
-        claim_token=x_guest_claim_token if not user.is_authenticated else None,
-        expires_at=expires_at,
-    )
-    db.add(url)
+    original_url = str(url_data.original_url)
+    values = {
+        "original_url": original_url,
+        "user_id": user.user_id if user.is_authenticated else None,
+        "claim_token": x_guest_claim_token if not user.is_authenticated else None,
+        "expires_at": expires_at,
+    }
+
+    # Insert optimistically and let the unique index on short_code detect
+    # collisions, instead of checking for an existing row first
+    attempts = 1 if url_data.custom_code else MAX_SHORT_CODE_ATTEMPTS
+    row = None
+    for _ in range(attempts):
+        short_code = url_data.custom_code or generate_short_code()
+        result = await db.execute(
+            pg_insert(URL)
+            .values(short_code=short_code, **values)
+            .on_conflict_do_nothing(index_elements=[URL.short_code])
+            .returning(URL.id, URL.created_at)
+        )
+        row = result.first()
+        if row is not None:
+            break
+
+    if row is None:
+        if url_data.custom_code:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Custom code already exists.",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Could not generate a unique short code. Please try again.",
+        )
     await db.commit()
-    await db.refresh(url)
 
     # Cache the URL
-    await cache_url(
-        short_code,
-        url.original_url,
-        expires_at=expires_at.isoformat() if expires_at else None,
-    )
+    await cache_url(short_code, original_url, expires_at=expires_at)
 
     # Track successful URL creation
-    urls_created_total.labels(status="success").inc()
+    _URLS_CREATED.inc()
 
-    return URLResponse(
-        id=url.id,
-        short_code=url.short_code,
-        original_url=url.original_url,
-        short_url=f"{settings.base_url}/s/{url.short_code}",
-        created_at=url.created_at,
-        expires_at=url.expires_at,
+    # Built from values we just wrote, so skip pydantic validation
+    return URLResponse.model_construct(
+        id=row.id,
+        short_code=short_code,
+        original_url=original_url,
+        short_url=f"{SHORT_URL_PREFIX}{short_code}",
+        created_at=row.created_at,
+        expires_at=expires_at,
     )
 
 
@@ -148,10 +238,13 @@ async def claim_guest_urls(
         .where(URL.claim_token == claim_data.claim_token)
         .where(URL.user_id.is_(None))
         .values(user_id=current_user.user_id, claim_token=None)
+        .returning(URL.short_code)
     )
+    claimed_codes = result.scalars().all()
     await db.commit()
 
-    claimed_count = result.rowcount
+    claimed_count = len(claimed_codes)
+    await invalidate_urls(claimed_codes)
 
     # Track claimed URLs
     if claimed_count > 0:
@@ -170,23 +263,10 @@ async def get_url_info(
     user: OptionalUser = Depends(get_optional_user),
 ):
     """Get URL info with click statistics."""
-    result = await db.execute(
-        select(URL).where(URL.short_code == short_code)
-    )
-    url = result.scalar_one_or_none()
+    url = await _load_url(db, short_code)
 
     if not url:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Short URL not found.",
-        )
-
-
-    if url.is_expired:
-        raise HTTPException(
-            status_code=status.HTTP_410_GONE,
-            detail="This short URL has expired.",
-        )
+        raise await _missing_url_error(db, short_code)
 
     click_count = await get_click_count(short_code)
 
@@ -194,7 +274,7 @@ async def get_url_info(
     if user.is_authenticated and url.user_id:
         is_owner = str(url.user_id) == user.user_id
 
-    return URLInfo(
+    return URLInfo.model_construct(
         id=url.id,
         short_code=url.short_code,
         original_url=url.original_url,
@@ -249,54 +329,45 @@ async def redirect_to_url(
     cached = await get_cached_url(short_code)
 
     if cached:
-        url_lookups_total.labels(source="cache").inc()
+        _LOOKUP_CACHE.inc()
         original_url = cached["original_url"]
-        if cached.get("expires_at"):
-            expires_at = datetime.fromisoformat(cached["expires_at"])
-            if datetime.utcnow() > expires_at:
-                redirects_total.labels(status="expired").inc()
-                raise HTTPException(
-                    status_code=status.HTTP_410_GONE,
-                    detail="This short URL has expired.",
-                )
-    else:
-        url_lookups_total.labels(source="database").inc()
-        result = await db.execute(
-            select(URL).where(URL.short_code == short_code)
-        )
-        url = result.scalar_one_or_none()
-
-        if not url:
-            redirects_total.labels(status="not_found").inc()
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Short URL not found.",
-            )
-
-
-        if url.is_expired:
-            redirects_total.labels(status="expired").inc()
+        if cached.get("exp_ts") and time.time() > cached["exp_ts"]:
+            _REDIRECT_EXPIRED.inc()
             raise HTTPException(
                 status_code=status.HTTP_410_GONE,
                 detail="This short URL has expired.",
             )
+    else:
+        _LOOKUP_DB.inc()
+        url = await _load_redirect_target(db, short_code)
 
-        original_url = url.original_url
+        if not url:
+            error = await _missing_url_error(db, short_code)
+            if error.status_code == status.HTTP_410_GONE:
+                _REDIRECT_EXPIRED.inc()
+            else:
+                _REDIRECT_NOT_FOUND.inc()
+            raise error
 
+        original_url = url.original_url
 
-        await cache_url(
+        # Write back after the response is sent rather than delaying the redirect
+        background_tasks.add_task(
+            cache_url,
             short_code,
             original_url,
-            expires_at=url.expires_at.isoformat() if url.expires_at else None,
+            expires_at=url.expires_at,
         )
 
     background_tasks.add_task(track_click, short_code, original_url)
-    redirects_total.labels(status="success").inc()
+    _REDIRECT_SUCCESS.inc()
     redirect_latency.observe(time.time() - start_time)
 
-    return RedirectResponse(
-        url=original_url,
+    # original_url was normalised by HttpUrl on create, so it can go into the
+    # header as-is without RedirectResponse's re-quoting
+    return Response(
         status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+        headers={"location": original_url},
     )
 
 
@@ -320,11 +391,11 @@ async def list_urls(
     urls = result.scalars().all()
 
     return [
-        URLListItem(
+        URLListItem.model_construct(
             id=url.id,
             short_code=url.short_code,
             original_url=url.original_url,
-            short_url=f"{settings.base_url}/s/{url.short_code}",
+            short_url=f"{SHORT_URL_PREFIX}{url.short_code}",
             created_at=url.created_at,
             expires_at=url.expires_at,
         )
@@ -346,33 +417,39 @@ async def get_qr_code(
             detail="Size must be between 100 and 1000 pixels.",
         )
 
-    # Verify URL exists
-    result = await db.execute(
-        select(URL).where(URL.short_code == short_code)
-    )
-    url = result.scalar_one_or_none()
+    headers = {"Content-Disposition": f"inline; filename=qr-{short_code}.png"}
+
+    # Cached images are dropped when the URL is deleted and never outlive
+    # its expiry, so a hit can skip the existence check
+    png = await get_cached_qr(short_code, size)
+    if png:
+        return Response(content=png, media_type="image/png", headers=headers)
+
+    # Verify URL exists and is active
+    result = await db.execute(_EXPIRY_BY_CODE, _lookup_params(short_code))
+    url = result.one_or_none()
 
     if not url:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Short URL not found.",
-        )
+        raise await _missing_url_error(db, short_code)
 
-    if url.is_expired:
-        raise HTTPException(
-            status_code=status.HTTP_410_GONE,
-            detail="This short URL has expired.",
-        )
+    png = render_qr_png(f"{SHORT_URL_PREFIX}{short_code}", size)
+    await cache_qr(short_code, size, png, expires_at=url.expires_at)
+
+    # Track QR code generation
+    qr_codes_generated_total.inc()
 
-    # Generate QR code
-    short_url = f"{settings.base_url}/s/{short_code}"
+    return Response(content=png, media_type="image/png", headers=headers)
+
+
+def render_qr_png(data: str, size: int) -> bytes:
+    """Render ``data`` as a ``size`` x ``size`` PNG QR code."""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
         box_size=10,
         border=4,
     )
-    qr.add_data(short_url)
+    qr.add_data(data)
     qr.make(fit=True)
 
     img = qr.make_image(fill_color="black", back_color="white")
@@ -382,13 +459,4 @@ async def get_qr_code(
 
     img_bytes = io.BytesIO()
     img.save(img_bytes, format="PNG")
-    img_bytes.seek(0)
-
-    # Track QR code generation
-    qr_codes_generated_total.inc()
-
-    return StreamingResponse(
-        img_bytes,
-        media_type="image/png",
-        headers={"Content-Disposition": f"inline; filename=qr-{short_code}.png"},
-    )
+    return img_bytes.getvalue()
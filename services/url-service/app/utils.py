@@ -6,28 +6,55 @@ from app.config import get_settings
 
 settings = get_settings()
 
+_DEFAULT_LENGTH: int = settings.short_code_length
+
 ALPHABET = string.ascii_letters + string.digits
 
+# Random bytes map onto ALPHABET via b % 62. Bytes >= 248 (the largest
+# multiple of 62 below 256) are dropped so every character stays equally
+# likely.
+_ACCEPT_LIMIT = 256 - 256 % len(ALPHABET)
+_BYTE_TO_CHAR = bytes(ord(ALPHABET[b % len(ALPHABET)]) for b in range(256))
+_REJECTED_BYTES = bytes(range(_ACCEPT_LIMIT, 256))
+
+# Possessive quantifiers (Python 3.11+) where giving characters back can
+# never lead to a match, so a long rejected URL fails without backtracking
+# through its path or port digits.
+_URL_RE = re.compile(
+    r"https?://"
+    r"(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|"
+    r"localhost|"
+    r"\d{1,3}+\.\d{1,3}+\.\d{1,3}+\.\d{1,3}+)"
+    r"(?::\d++)?"
+    r"(?:/?|[/?]\S++)",
+    re.IGNORECASE,
+)
+
 
 def generate_short_code(length: int | None = None) -> str:
     if length is None:
-        length = settings.short_code_length
-    return "".join(secrets.choice(ALPHABET) for _ in range(length))
+        length = _DEFAULT_LENGTH
+    code = b""
+    while len(code) < length:
+        # Oversample slightly so one draw almost always covers the rejections
+        raw = secrets.token_bytes(length + length // 4 + 2)
+        code += raw.translate(_BYTE_TO_CHAR, _REJECTED_BYTES)
+    return code[:length].decode("ascii")
 
 
 def is_valid_short_code(code: str) -> bool:
-    pattern = r"^[a-zA-Z0-9]+$"
-    return bool(re.match(pattern, code)) and 3 <= len(code) <= 10
+    # isascii() first so isalnum() only accepts [A-Za-z0-9], not other
+    # Unicode letters or digits
+    return 3 <= len(code) <= 10 and code.isascii() and code.isalnum()
+
+
+_URL_SCHEMES = ("http://", "https://")
+_MAX_URL_LENGTH = 2048
 
 
 def validate_url(url: str) -> bool:
-    pattern = re.compile(
-        r"^https?://"
-        r"(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|"
-        r"localhost|"
-        r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"
-        r"(?::\d+)?"
-        r"(?:/?|[/?]\S+)$",
-        re.IGNORECASE,
-    )
-    return bool(pattern.match(url))
+    if len(url) > _MAX_URL_LENGTH:
+        return False
+    # Cheap scheme check first; most rejected input fails here. Lowercased
+    # because the regex itself is case-insensitive.
+    return url[:8].lower().startswith(_URL_SCHEMES) and _URL_RE.fullmatch(url) is not None
@@ -6,20 +6,30 @@ Uses the actual PostgreSQL and Redis from Docker Compose for realistic testing.
 import asyncio
 import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
 from typing import AsyncGenerator
 
 import jwt
 import pytest
 import pytest_asyncio
+from fastapi.testclient import TestClient
 from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, Mock
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop isn't available on Windows
+    uvloop = None
 
 from app.database import Base, get_db
 from app.main import app
 from app.config import get_settings
 from app.models import URL
+from app.utils import generate_short_code
 
 # Test configuration
 TEST_DATABASE_URL = os.environ.get(
@@ -28,19 +38,69 @@ TEST_DATABASE_URL = os.environ.get(
 )
 TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/1")
 
+# Under pytest-xdist each worker gets its own database (e.g.
+# urlshortener_test_gw0) so session-scoped schemas don't collide
+XDIST_WORKER = os.environ.get("PYTEST_XDIST_WORKER")
+
+
+def _worker_database_url() -> str:
+    """Return TEST_DATABASE_URL, suffixed with the xdist worker id if any."""
+    if XDIST_WORKER is None:
+        return TEST_DATABASE_URL
+    url = make_url(TEST_DATABASE_URL)
+    return url.set(database=f"{url.database}_{XDIST_WORKER}").render_as_string(
+        hide_password=False
+    )
+
+
+async def _ensure_database(database_url: str):
+    """Create the database named in database_url if it doesn't exist yet."""
+    database = make_url(database_url).database
+    admin_engine = create_async_engine(TEST_DATABASE_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin_engine.connect() as conn:
+            exists = await conn.scalar(
+                text("SELECT 1 FROM pg_database WHERE datname = :name"),
+                {"name": database},
+            )
+            if not exists:
+                await conn.execute(text(f'CREATE DATABASE "{database}"'))
+    finally:
+        await admin_engine.dispose()
+
+
+def pytest_collection_modifyitems(items):
+    """Run every async test on the session event loop shared with the fixtures."""
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if pytest_asyncio.is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
 
 @pytest.fixture(scope="session")
-def event_loop():
-    """Create an instance of the default event loop for each test session."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+def event_loop_policy():
+    """Run tests on the same loop implementation the service uses in production."""
+    if uvloop is not None:
+        return uvloop.EventLoopPolicy()
+    return asyncio.DefaultEventLoopPolicy()
 
 
-@pytest_asyncio.fixture(scope="function")
+@pytest_asyncio.fixture(scope="session")
 async def test_engine():
-    """Create a test database engine."""
-    engine = create_async_engine(TEST_DATABASE_URL, echo=False)
+    """Create a test database engine and schema once per session."""
+    database_url = _worker_database_url()
+    if XDIST_WORKER is not None:
+        await _ensure_database(database_url)
+
+    # Pooled connections are reused across tests; the DB is local so no pre-ping
+    engine = create_async_engine(
+        database_url,
+        echo=False,
+        pool_size=5,
+        max_overflow=10,
+        pool_recycle=1800,
+        pool_pre_ping=False,
+    )
 
     # Create all tables
     async with engine.begin() as conn:
@@ -57,22 +117,115 @@ async def test_engine():
 
 @pytest_asyncio.fixture(scope="function")
 async def db_session(test_engine) -> AsyncGenerator[AsyncSession, None]:
-    """Create a test database session."""
-    async_session = async_sessionmaker(
-        bind=test_engine,
-        class_=AsyncSession,
-        expire_on_commit=False,
-        autocommit=False,
-        autoflush=False,
-    )
+    """
+    Create a test database session isolated in a rolled-back transaction.
+
+    The session joins an outer transaction and turns its own commits into
+    SAVEPOINT releases, so rolling back the outer transaction afterwards
+    leaves the database as it was without recreating the schema.
+    """
+    async with test_engine.connect() as conn:
+        transaction = await conn.begin()
+        async_session = async_sessionmaker(
+            bind=conn,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+            join_transaction_mode="create_savepoint",
+        )
+
+        async with async_session() as session:
+            yield session
+
+        await transaction.rollback()
+
+
+@pytest.fixture(autouse=True)
+def _reset_dependency_overrides():
+    """Drop any dependency overrides a test or fixture installed."""
+    yield
+    app.dependency_overrides.clear()
+
+
+@pytest_asyncio.fixture(scope="session")
+async def shared_client() -> AsyncGenerator[AsyncClient, None]:
+    """
+    One ASGI transport and HTTP client for the whole session.
+
+    Tests get it through client / client_with_cache / validation_client,
+    which install the per-test database override.
+    """
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        yield ac
 
-    async with async_session() as session:
-        yield session
-        await session.rollback()
+
+# Redis cache stand-ins, created once and reset per test by the client fixtures
+_CACHE_MOCK_DEFAULTS = {
+    "app.routes.cache_url": None,
+    "app.routes.get_cached_url": None,
+    "app.routes.invalidate_url": None,
+    "app.routes.invalidate_urls": None,
+    "app.routes.cache_health_check": True,
+    "app.routes.cache_qr": None,
+    "app.routes.get_cached_qr": None,
+}
+_CACHE_MOCKS = {
+    target: AsyncMock(return_value=default)
+    for target, default in _CACHE_MOCK_DEFAULTS.items()
+}
+
+
+def _install_cache_mocks(monkeypatch):
+    """Patch the cache helpers in app.routes with freshly reset mocks."""
+    for target, mock in _CACHE_MOCKS.items():
+        mock.reset_mock(return_value=True, side_effect=True)
+        mock.return_value = _CACHE_MOCK_DEFAULTS[target]
+        monkeypatch.setattr(target, mock)
+
+
+# PNG signature only; route tests check the response contract, not the image
+FAKE_QR_PNG = b"\x89PNG\r\n\x1a\n"
+
+# Stand-ins for the Analytics service calls and QR rendering, installed
+# for the whole session
+_ROUTE_MOCKS = SimpleNamespace(
+    get_click_count=AsyncMock(return_value=0),
+    track_click=AsyncMock(return_value=True),
+    render_qr_png=Mock(return_value=FAKE_QR_PNG),
+)
+_ROUTE_MOCK_DEFAULTS = {
+    "get_click_count": 0,
+    "track_click": True,
+    "render_qr_png": FAKE_QR_PNG,
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _stub_route_dependencies():
+    """Keep tests off the network and skip image encoding, patching once."""
+    with pytest.MonkeyPatch.context() as mp:
+        for name, mock in vars(_ROUTE_MOCKS).items():
+            mp.setattr(f"app.routes.{name}", mock)
+        yield
+
+
+@pytest.fixture(autouse=True)
+def mocks() -> SimpleNamespace:
+    """
+    The Analytics and QR rendering mocks, reset for each test.
+
+    Set e.g. ``mocks.get_click_count.return_value = 42`` in a test.
+    """
+    for name, default in _ROUTE_MOCK_DEFAULTS.items():
+        mock = getattr(_ROUTE_MOCKS, name)
+        mock.reset_mock(return_value=True, side_effect=True)
+        mock.return_value = default
+    return _ROUTE_MOCKS
 
 
 @pytest_asyncio.fixture(scope="function")
-async def client(db_session) -> AsyncGenerator[AsyncClient, None]:
+async def client(db_session, shared_client, monkeypatch) -> AsyncGenerator[AsyncClient, None]:
     """Create a test HTTP client with database session override."""
 
     async def override_get_db():
@@ -81,25 +234,13 @@ async def client(db_session) -> AsyncGenerator[AsyncClient, None]:
     app.dependency_overrides[get_db] = override_get_db
 
     # Mock Redis cache to avoid needing actual Redis in tests
-    with patch("app.routes.cache_url", new_callable=AsyncMock) as mock_cache, \
-         patch("app.routes.get_cached_url", new_callable=AsyncMock) as mock_get_cache, \
-         patch("app.routes.invalidate_url", new_callable=AsyncMock) as mock_invalidate, \
-         patch("app.routes.cache_health_check", new_callable=AsyncMock) as mock_health:
+    _install_cache_mocks(monkeypatch)
 
-        mock_cache.return_value = None
-        mock_get_cache.return_value = None  
-        mock_invalidate.return_value = None
-        mock_health.return_value = True
-
-        transport = ASGITransport(app=app)
-        async with AsyncClient(transport=transport, base_url="http://test") as ac:
-            yield ac
-
-    app.dependency_overrides.clear()
+    yield shared_client
 
 
 @pytest_asyncio.fixture
-async def client_with_cache(db_session) -> AsyncGenerator[AsyncClient, None]:
+async def client_with_cache(db_session, shared_client) -> AsyncGenerator[AsyncClient, None]:
     """Create a test HTTP client with mocked cache that returns data."""
 
     async def override_get_db():
@@ -107,68 +248,142 @@ async def client_with_cache(db_session) -> AsyncGenerator[AsyncClient, None]:
 
     app.dependency_overrides[get_db] = override_get_db
 
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url="http://test") as ac:
-        yield ac
+    yield shared_client
 
-    app.dependency_overrides.clear()
+
+class _NoDatabaseSession:
+    """Session stand-in that fails the test on any use."""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"Unexpected database access: session.{name}")
+
+
+@pytest_asyncio.fixture
+async def validation_client(shared_client) -> AsyncGenerator[AsyncClient, None]:
+    """
+    Create a test HTTP client for requests rejected before any DB access.
+
+    No database session or transaction is set up; a route that reaches
+    the database fails the test instead.
+    """
+
+    async def override_get_db():
+        yield _NoDatabaseSession()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    yield shared_client
+
+
+class _EmptyDatabaseSession:
+    """Session stand-in on which every lookup finds no rows."""
+
+    async def execute(self, *args, **kwargs):
+        result = MagicMock()
+        result.scalar_one_or_none.return_value = None
+        result.one_or_none.return_value = None
+        result.first.return_value = None
+        return result
 
 
 @pytest.fixture
+def sync_client(monkeypatch) -> TestClient:
+    """
+    Create a synchronous test client for plain status/JSON checks.
+
+    Lookups run against an empty stand-in session, so this suits health,
+    metrics and not-found responses. The app runs on the client's own
+    loop, not the session loop, so it can't share db_session.
+    """
+
+    async def override_get_db():
+        yield _EmptyDatabaseSession()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    _install_cache_mocks(monkeypatch)
+
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def generated_short_codes() -> list[str]:
+    """10,000 eight-character codes from generate_short_code, made once per session."""
+    return [generate_short_code(8) for _ in range(10_000)]
+
+
+@pytest.fixture(scope="session")
 def settings():
     """Get application settings."""
     return get_settings()
 
 
-@pytest.fixture
-def test_user_id() -> str:
+@pytest.fixture(scope="session")
+def test_user_id() -> uuid.UUID:
     """Generate a test user ID."""
-    return str(uuid.uuid4())
+    return uuid.uuid4()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
+def test_user_id_str(test_user_id) -> str:
+    """The test user ID as it appears in JWT payloads."""
+    return str(test_user_id)
+
+
+@pytest.fixture(scope="session")
 def another_user_id() -> str:
     """Generate another test user ID for permission tests."""
     return str(uuid.uuid4())
 
 
-@pytest.fixture
-def auth_token(settings, test_user_id) -> str:
-    """Generate a valid JWT token for testing."""
-    payload = {
-        "userId": test_user_id,
-        "exp": datetime.utcnow() + timedelta(hours=1),
-        "iat": datetime.utcnow(),
+@pytest.fixture(scope="session")
+def now() -> datetime:
+    """Session start in UTC; token claims are offsets from it."""
+    return datetime.now(timezone.utc)
+
+
+@pytest.fixture(scope="session")
+def token_pool(settings, test_user_id_str, another_user_id, now) -> dict[str, str]:
+    """
+    Every JWT the tests use, signed once per session.
+
+    Valid tokens expire after 24h so they outlive any test run.
+    """
+
+    def sign(user_id: str, issued_at: datetime, expires_at: datetime) -> str:
+        payload = {"userId": user_id, "exp": expires_at, "iat": issued_at}
+        return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
+
+    return {
+        "auth": sign(test_user_id_str, now, now + timedelta(hours=24)),
+        "another": sign(another_user_id, now, now + timedelta(hours=24)),
+        "expired": sign(test_user_id_str, now - timedelta(hours=2), now - timedelta(hours=1)),
+        "invalid": "invalid.token.here",
     }
-    return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
 
 
-@pytest.fixture
-def another_auth_token(settings, another_user_id) -> str:
+@pytest.fixture(scope="session")
+def auth_token(token_pool) -> str:
+    """Generate a valid JWT token for testing."""
+    return token_pool["auth"]
+
+
+@pytest.fixture(scope="session")
+def another_auth_token(token_pool) -> str:
     """Generate a JWT token for another user."""
-    payload = {
-        "userId": another_user_id,
-        "exp": datetime.utcnow() + timedelta(hours=1),
-        "iat": datetime.utcnow(),
-    }
-    return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
+    return token_pool["another"]
 
 
-@pytest.fixture
-def expired_token(settings, test_user_id) -> str:
+@pytest.fixture(scope="session")
+def expired_token(token_pool) -> str:
     """Generate an expired JWT token for testing."""
-    payload = {
-        "userId": test_user_id,
-        "exp": datetime.utcnow() - timedelta(hours=1),
-        "iat": datetime.utcnow() - timedelta(hours=2),
-    }
-    return jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
+    return token_pool["expired"]
 
 
-@pytest.fixture
-def invalid_token() -> str:
+@pytest.fixture(scope="session")
+def invalid_token(token_pool) -> str:
     """Generate an invalid JWT token for testing."""
-    return "invalid.token.here"
+    return token_pool["invalid"]
 
 
 @pytest.fixture
@@ -189,60 +404,118 @@ def guest_claim_token() -> str:
     return str(uuid.uuid4())
 
 
-@pytest_asyncio.fixture
-async def sample_url(db_session, test_user_id) -> URL:
-    """Create a sample URL for testing."""
-    url = URL(
+def _make_sample_url(user_id: uuid.UUID) -> URL:
+    return URL(
         short_code="test123",
         original_url="https://example.com/test",
-        user_id=uuid.UUID(test_user_id),
+        user_id=user_id,
     )
-    db_session.add(url)
-    await db_session.commit()
-    await db_session.refresh(url)
-    return url
 
 
-@pytest_asyncio.fixture
-async def guest_url(db_session, guest_claim_token) -> URL:
-    """Create a guest URL (no user_id) for testing."""
-    url = URL(
+def _make_guest_url(claim_token: str) -> URL:
+    return URL(
         short_code="guest1",
         original_url="https://example.com/guest",
         user_id=None,
-        claim_token=guest_claim_token,
+        claim_token=claim_token,
     )
-    db_session.add(url)
-    await db_session.commit()
-    await db_session.refresh(url)
-    return url
 
 
-@pytest_asyncio.fixture
-async def expired_url(db_session, test_user_id) -> URL:
-    """Create an expired URL for testing."""
-    url = URL(
+def _make_expired_url(user_id: uuid.UUID) -> URL:
+    return URL(
         short_code="exprd1",
         original_url="https://example.com/expired",
-        user_id=uuid.UUID(test_user_id),
+        user_id=user_id,
         expires_at=datetime.utcnow() - timedelta(days=1),
     )
+
+
+def _make_future_expiring_url(user_id: uuid.UUID) -> URL:
+    return URL(
+        short_code="future1",
+        original_url="https://example.com/future",
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=30),
+    )
+
+
+# URL fixtures only flush: the rows are visible to the routes through the
+# same session and are discarded with the test's outer transaction, so a
+# commit (SAVEPOINT release and restart) would be wasted round-trips.
+# Column defaults are applied client-side, so no refresh() is needed either.
+
+@pytest_asyncio.fixture
+async def sample_url(db_session, test_user_id) -> URL:
+    """Create a sample URL for testing."""
+    url = _make_sample_url(test_user_id)
     db_session.add(url)
-    await db_session.commit()
-    await db_session.refresh(url)
+    await db_session.flush()
     return url
 
 
 @pytest_asyncio.fixture
-async def future_expiring_url(db_session, test_user_id) -> URL:
-    """Create a URL that expires in the future."""
+async def guest_url(db_session, guest_claim_token) -> URL:
+    """Create a guest URL (no user_id) for testing."""
+    url = _make_guest_url(guest_claim_token)
+    db_session.add(url)
+    await db_session.flush()
+    return url
+
+
+@pytest_asyncio.fixture(scope="session")
+async def expiring_url(test_engine) -> URL:
+    """
+    Create a URL that expires an hour into the session, committed once.
+
+    Expiry tests move the clock past it with time_machine (see
+    after_expiry) instead of each inserting an already-expired row. It
+    belongs to a user no test authenticates as, so listings don't see it.
+    """
     url = URL(
-        short_code="future1",
-        original_url="https://example.com/future",
-        user_id=uuid.UUID(test_user_id),
-        expires_at=datetime.utcnow() + timedelta(days=30),
+        short_code="expsoon",
+        original_url="https://example.com/expiring",
+        user_id=uuid.uuid4(),
+        expires_at=datetime.utcnow() + timedelta(hours=1),
     )
+    async with async_sessionmaker(test_engine, expire_on_commit=False)() as session:
+        session.add(url)
+        await session.commit()
+    return url
+
+
+@pytest.fixture(scope="session")
+def after_expiry(expiring_url) -> datetime:
+    """
+    A moment just past expiring_url's expiry, for time_machine.travel().
+
+    Session tokens stay valid then, since they last 24h.
+    """
+    # expires_at is naive UTC; time_machine reads naive datetimes as local
+    return expiring_url.expires_at.replace(tzinfo=timezone.utc) + timedelta(minutes=1)
+
+
+@pytest_asyncio.fixture
+async def future_expiring_url(db_session, test_user_id) -> URL:
+    """Create a URL that expires in the future."""
+    url = _make_future_expiring_url(test_user_id)
     db_session.add(url)
-    await db_session.commit()
-    await db_session.refresh(url)
+    await db_session.flush()
     return url
+
+
+@pytest_asyncio.fixture
+async def urls_bundle(db_session, test_user_id, guest_claim_token) -> SimpleNamespace:
+    """
+    Create the sample, guest, expired and future-expiring URLs in one flush.
+
+    Use instead of the individual URL fixtures when a test needs several.
+    """
+    bundle = SimpleNamespace(
+        sample=_make_sample_url(test_user_id),
+        guest=_make_guest_url(guest_claim_token),
+        expired=_make_expired_url(test_user_id),
+        future=_make_future_expiring_url(test_user_id),
+    )
+    db_session.add_all(vars(bundle).values())
+    await db_session.flush()
+    return bundle
@@ -0,0 +1,60 @@
+"""
+Tests for the aggregator module.
+
+Tests the circuit breaker guarding calls to the Analytics service.
+"""
+import pytest
+from unittest.mock import patch
+
+from app import aggregator
+from app.aggregator import CircuitBreaker, get_click_count
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker."""
+
+    def test_opens_after_threshold(self):
+        """Breaker should open after consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.allow() is True
+
+        breaker.record_failure()
+        assert breaker.allow() is False
+
+    def test_success_resets_failures(self):
+        """A success should close the breaker and reset the count."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.allow() is True
+
+    def test_allows_trial_after_reset_timeout(self):
+        """Breaker should let a call through once the timeout elapses."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+
+        breaker.record_failure()
+
+        assert breaker.allow() is True
+
+
+class TestGetClickCount:
+    """Tests for get_click_count."""
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_request(self):
+        """No request should be made while the circuit is open."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+
+        with patch.object(aggregator, "_click_count_breaker", breaker), \
+             patch.object(aggregator, "get_http_client") as mock_client:
+            count = await get_click_count("abc123")
+
+        assert count == 0
+        mock_client.assert_not_called()
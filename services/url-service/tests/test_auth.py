@@ -6,6 +6,7 @@ Tests JWT token decoding and user authentication functions.
 import pytest
 from datetime import datetime, timedelta
 import uuid
+from unittest.mock import patch
 
 import jwt
 from fastapi import HTTPException
@@ -102,6 +103,71 @@ class TestDecodeToken:
         assert exc_info.value.status_code == 401
         assert "invalid" in exc_info.value.detail.lower()
 
+    def test_decode_token_with_audience(self, settings):
+        """Token issued for an audience should be rejected."""
+        token = jwt.encode(
+            {"userId": str(uuid.uuid4()), "aud": "other-service"},
+            settings.jwt_secret,
+            algorithm="HS256",
+        )
+
+        with pytest.raises(HTTPException) as exc_info:
+            decode_token(token)
+
+        assert exc_info.value.status_code == 401
+        assert "invalid" in exc_info.value.detail.lower()
+
+    def test_decode_token_tampered_payload(self, settings):
+        """Token whose payload was altered after signing should fail."""
+        payload = {
+            "userId": str(uuid.uuid4()),
+            "exp": datetime.utcnow() + timedelta(hours=1),
+        }
+        token = jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
+        header, _, signature = token.split(".")
+        forged = jwt.encode(
+            {**payload, "userId": str(uuid.uuid4())},
+            settings.jwt_secret,
+            algorithm="HS256",
+        ).split(".")[1]
+
+        with pytest.raises(HTTPException) as exc_info:
+            decode_token(f"{header}.{forged}.{signature}")
+
+        assert exc_info.value.status_code == 401
+        assert "invalid" in exc_info.value.detail.lower()
+
+    def test_decode_token_cached(self, settings):
+        """Repeated decodes of the same token should skip verification."""
+        user_id = str(uuid.uuid4())
+        payload = {
+            "userId": user_id,
+            "exp": datetime.utcnow() + timedelta(hours=1),
+            "iat": datetime.utcnow(),
+        }
+        token = jwt.encode(payload, settings.jwt_secret, algorithm="HS256")
+
+        first = decode_token(token)
+        with patch("app.auth._verify_hs256") as mock_verify:
+            second = decode_token(token)
+
+        mock_verify.assert_not_called()
+        assert second.user_id == first.user_id == user_id
+
+    def test_decode_token_rejection_cached(self):
+        """A rejected token should be refused again without re-verifying."""
+        token = f"not.a.token-{uuid.uuid4()}"
+
+        with pytest.raises(HTTPException):
+            decode_token(token)
+        with patch("app.auth._verify_hs256") as mock_verify:
+            with pytest.raises(HTTPException) as exc_info:
+                decode_token(token)
+
+        mock_verify.assert_not_called()
+        assert exc_info.value.status_code == 401
+        assert exc_info.value.detail == "Invalid token"
+
 class TestTokenDataModel:
     """Tests for TokenData Pydantic model."""
 
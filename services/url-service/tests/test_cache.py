@@ -0,0 +1,259 @@
+"""
+Tests for the caching helpers.
+
+Covers request coalescing for concurrent cache misses, the per-worker
+cache in front of Redis, and QR code caching.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Generator
+
+import orjson
+import pytest
+
+from app import cache
+from app.cache import (
+    LOCAL_CACHE_TTL,
+    cache_qr,
+    cache_url,
+    get_cached_url,
+    invalidate_urls,
+    singleflight,
+)
+
+
+class _FakePipeline:
+    """Queues commands and runs them against FakeRedis on execute()."""
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def get(self, key):
+        self.commands.append(("get", (key,)))
+
+    def pttl(self, key):
+        self.commands.append(("pttl", (key,)))
+
+    def hset(self, key, field, value):
+        self.commands.append(("hset", (key, field, value)))
+
+    def expire(self, key, ttl):
+        self.commands.append(("expire", (key, ttl)))
+
+    async def execute(self):
+        self.redis.pipelines.append([name for name, _ in self.commands])
+        return [getattr(self.redis, f"_{name}")(*args) for name, args in self.commands]
+
+
+class FakeRedis:
+    """In-memory stand-in for the Redis calls the URL cache makes."""
+
+    def __init__(self):
+        self.values = {}
+        self.pttls = {}
+        self.pipelines = []
+
+    def set(self, key, data: dict, pttl: int = -1):
+        self.values[key] = orjson.dumps(data)
+        self.pttls[key] = pttl
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    def _get(self, key):
+        return self.values.get(key)
+
+    def _pttl(self, key):
+        # Redis returns -2 for a missing key and -1 for one with no expiry
+        return self.pttls.get(key, -2)
+
+    def _hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    def _expire(self, key, ttl):
+        self.pttls[key] = ttl * 1000
+
+    async def setex(self, key, ttl, value):
+        self.values[key] = value
+        self.pttls[key] = ttl * 1000
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self.pttls.pop(key, None)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch) -> Generator[FakeRedis, None, None]:
+    """Point the cache module at an in-memory Redis with an empty local cache."""
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, "_redis_client", redis)
+    cache._local_cache.clear()
+    yield redis
+    cache._local_cache.clear()
+
+
+class TestSingleflight:
+    """Tests for singleflight request coalescing."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_fetch(self):
+        """Concurrent callers with the same key should run fetch once."""
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(
+            *(singleflight("shared", fetch) for _ in range(5))
+        )
+
+        assert results == ["result"] * 5
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_exception_propagates_to_all_callers(self):
+        """Every waiting caller should see the fetch error."""
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ValueError("lookup failed")
+
+        results = await asyncio.gather(
+            *(singleflight("failing", fetch) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_leader_cancellation_does_not_cancel_followers(self):
+        """Waiting callers should retry the fetch if the first caller is cancelled."""
+        calls = 0
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        leader = asyncio.create_task(singleflight("cancelled", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(singleflight("cancelled", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == "result"
+        assert leader.cancelled()
+        assert calls == 2
+
+
+class TestLocalCache:
+    """Tests for the per-worker cache in front of Redis."""
+
+    @pytest.mark.asyncio
+    async def test_miss_reads_value_and_ttl_in_one_pipeline(self, fake_redis):
+        """A cold lookup should fetch GET and PTTL in a single round-trip."""
+        fake_redis.set("url:v2:abc123", {"original_url": "https://example.com"}, pttl=60_000)
+
+        data = await get_cached_url("abc123")
+
+        assert data == {"original_url": "https://example.com"}
+        assert fake_redis.pipelines == [["get", "pttl"]]
+
+    @pytest.mark.asyncio
+    async def test_hit_is_served_locally(self, fake_redis):
+        """A second lookup should not go back to Redis."""
+        fake_redis.set("url:v2:abc123", {"original_url": "https://example.com"}, pttl=60_000)
+
+        await get_cached_url("abc123")
+        data = await get_cached_url("abc123")
+
+        assert data == {"original_url": "https://example.com"}
+        assert len(fake_redis.pipelines) == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(
+        "pttl, max_ttl",
+        [(2_000, 2), (-1, LOCAL_CACHE_TTL)],
+        ids=["capped_by_redis_ttl", "no_redis_expiry"],
+    )
+    async def test_deadline(self, fake_redis, pttl, max_ttl):
+        """The local entry never outlives the Redis key; keys without a TTL get the default."""
+        fake_redis.set("url:v2:abc123", {"original_url": "https://example.com"}, pttl=pttl)
+
+        before = time.monotonic()
+        await get_cached_url("abc123")
+        after = time.monotonic()
+
+        _, deadline = cache._local_cache["abc123"]
+        assert before + max_ttl <= deadline <= after + max_ttl
+
+    @pytest.mark.asyncio
+    async def test_entry_past_deadline_is_evicted(self, fake_redis):
+        """An entry past its deadline should be dropped and Redis asked again."""
+        cache._local_cache["abc123"] = (
+            {"original_url": "https://example.com/stale"},
+            time.monotonic() - 1,
+        )
+
+        data = await get_cached_url("abc123")
+
+        assert data is None
+        assert "abc123" not in cache._local_cache
+        assert fake_redis.pipelines == [["get", "pttl"]]
+
+    @pytest.mark.asyncio
+    async def test_cache_url_stores_locally(self, fake_redis):
+        """cache_url should fill the local cache as well as Redis."""
+        await cache_url("abc123", "https://example.com", ttl=3600)
+
+        assert "url:v2:abc123" in fake_redis.values
+        fake_redis.values.clear()
+        assert await get_cached_url("abc123") == {"original_url": "https://example.com"}
+        assert fake_redis.pipelines == []
+
+    @pytest.mark.asyncio
+    async def test_invalidate_urls_clears_local_and_redis(self, fake_redis):
+        """invalidate_urls should drop both the local entry and the Redis keys."""
+        await cache_url("abc123", "https://example.com")
+
+        await invalidate_urls(["abc123"])
+
+        assert "abc123" not in cache._local_cache
+        assert fake_redis.values == {}
+        assert await get_cached_url("abc123") is None
+
+
+class TestCacheQR:
+    """Tests for QR code caching."""
+
+    @pytest.mark.asyncio
+    async def test_ttl_capped_at_url_expiry(self, fake_redis):
+        """A cached image should expire no later than its URL."""
+        expires_at = datetime.utcnow() + timedelta(minutes=10)
+
+        await cache_qr("abc123", 200, b"png", expires_at=expires_at)
+
+        assert fake_redis.values["qr:abc123"] == {200: b"png"}
+        assert 590_000 <= fake_redis.pttls["qr:abc123"] <= 600_000
+
+    @pytest.mark.asyncio
+    async def test_skips_url_expiring_within_a_second(self, fake_redis):
+        """Nothing should be written for a URL about to expire."""
+        expires_at = datetime.utcnow() + timedelta(milliseconds=500)
+
+        await cache_qr("abc123", 200, b"png", expires_at=expires_at)
+
+        assert fake_redis.values == {}
+        assert fake_redis.pipelines == []
@@ -17,13 +17,13 @@ class TestURLModel:
         url = URL(
             short_code="def123",
             original_url="https://example.com/defaults",
-            user_id=uuid.UUID(test_user_id)
+            user_id=test_user_id
         )
         db_session.add(url)
         await db_session.commit()
-        await db_session.refresh(url)
-
 
+        # The default is applied client-side before the INSERT and
+        # expire_on_commit=False keeps it loaded, so no refresh is needed
         assert url.created_at is not None
         assert isinstance(url.created_at, datetime)
         assert (datetime.utcnow() - url.created_at).total_seconds() < 1
@@ -35,7 +35,7 @@ class TestURLModel:
         url = URL(
             short_code="exp123",
             original_url="https://example.com/expires",
-            user_id=uuid.UUID(test_user_id),
+            user_id=test_user_id,
             expires_at=expires_at
         )
         db_session.add(url)
@@ -61,6 +61,12 @@ class TestURLModel:
         assert url.user_id is None
         assert url.claim_token == claim_token
 
+    def test_url_is_expired(self):
+        """is_expired compares expires_at (naive UTC) with the current time."""
+        assert URL(expires_at=None).is_expired is False
+        assert URL(expires_at=datetime.utcnow() - timedelta(minutes=1)).is_expired is True
+        assert URL(expires_at=datetime.utcnow() + timedelta(minutes=1)).is_expired is False
+
     @pytest.mark.asyncio
     async def test_url_representation(self):
         """Test string representation of the model."""
@@ -6,17 +6,30 @@ Tests all API endpoints with various scenarios including:
 - Error handling (404, 401, 403, 410)
 - Edge cases (custom codes, expiration, claiming)
 """
+import io
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
 import pytest
-from unittest.mock import AsyncMock, patch
+import time_machine
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+from unittest.mock import AsyncMock, MagicMock
+
+from app import routes
+from app.database import get_db
+from app.main import app
+from app.routes import SHORT_URL_PREFIX, render_qr_png
 
 
 class TestHealthEndpoint:
     """Tests for the /health endpoint."""
 
-    @pytest.mark.asyncio
-    async def test_health_check_returns_healthy(self, client):
+    def test_health_check_returns_healthy(self, sync_client):
         """Health check should return healthy status."""
-        response = await client.get("/health")
+        response = sync_client.get("/health")
 
         assert response.status_code == 200
         data = response.json()
@@ -26,6 +39,7 @@ class TestHealthEndpoint:
         assert "redis_healthy" in data
 
 
+@pytest.mark.xdist_group("db_write")
 class TestCreateURLEndpoint:
     """Tests for POST /api/urls endpoint."""
 
@@ -90,21 +104,6 @@ class TestCreateURLEndpoint:
         assert response.status_code == 409
         assert "already exists" in response.json()["detail"].lower()
 
-    @pytest.mark.asyncio
-    async def test_create_url_invalid_custom_code(self, client, auth_headers):
-        """Cannot create URL with invalid custom code."""
-        response = await client.post(
-            "/api/urls",
-            json={
-                "original_url": "https://example.com/test",
-                "custom_code": "ab",  # Too short
-            },
-            headers=auth_headers,
-        )
-
-        assert response.status_code == 400
-        assert "invalid custom code" in response.json()["detail"].lower()
-
     @pytest.mark.asyncio
     async def test_create_url_with_expiration(self, client, auth_headers):
         """Can create URL with expiration date."""
@@ -122,59 +121,90 @@ class TestCreateURLEndpoint:
         assert data["expires_at"] is not None
 
     @pytest.mark.asyncio
-    async def test_create_url_invalid_expiration(self, client, auth_headers):
-        """Cannot create URL with invalid expiration."""
-        response = await client.post(
+    @pytest.mark.parametrize(
+        "payload, expected_status, expected_detail",
+        [
+            # Too short
+            ({"original_url": "https://example.com/test", "custom_code": "ab"}, 400, "invalid custom code"),
+            # > 365
+            ({"original_url": "https://example.com/test", "expires_in_days": 400}, 422, None),
+            ({"original_url": "not-a-valid-url"}, 422, None),
+        ],
+        ids=["invalid_custom_code", "invalid_expiration", "invalid_url"],
+    )
+    async def test_create_url_rejected(
+        self, validation_client, auth_headers, payload, expected_status, expected_detail
+    ):
+        """Invalid create requests are rejected before reaching the database."""
+        response = await validation_client.post(
             "/api/urls",
-            json={
-                "original_url": "https://example.com/test",
-                "expires_in_days": 400,  # > 365
-            },
+            json=payload,
             headers=auth_headers,
         )
 
-        assert response.status_code == 422  
+        assert response.status_code == expected_status
+        if expected_detail is not None:
+            assert expected_detail in response.json()["detail"].lower()
+
     @pytest.mark.asyncio
-    async def test_create_url_invalid_url(self, client, auth_headers):
-        """Cannot create URL with invalid original URL."""
+    async def test_create_url_code_collisions(
+        self, client, db_session, auth_headers, sample_url, monkeypatch
+    ):
+        """Returns 503 once every generated code has collided."""
+        generate = MagicMock(return_value=sample_url.short_code)
+        monkeypatch.setattr("app.routes.generate_short_code", generate)
+        execute = AsyncMock(wraps=db_session.execute)
+        monkeypatch.setattr(db_session, "execute", execute)
+
         response = await client.post(
             "/api/urls",
-            json={"original_url": "not-a-valid-url"},
+            json={"original_url": "https://example.com/collide"},
             headers=auth_headers,
         )
 
-        assert response.status_code == 422
+        assert response.status_code == 503
+        assert generate.call_count == 5
+        assert execute.await_count == 5
 
     @pytest.mark.asyncio
-    @pytest.mark.skip(reason="DB mock doesn't work with client fixture's dependency override")
-    async def test_create_url_db_error(self, client, auth_headers):
+    async def test_create_url_db_error(self, auth_headers):
         """API should return 500 if database commit fails."""
-        with patch("app.routes.get_db") as mock_get_db:
-            mock_session = AsyncMock()
-            mock_session.commit.side_effect = Exception("DB Connection Lost")
-            mock_get_db.return_value = iter([mock_session])
+        mock_session = MagicMock()
+        mock_session.execute = AsyncMock(return_value=MagicMock(
+            first=MagicMock(return_value=SimpleNamespace(id=uuid.uuid4(), created_at=datetime.utcnow())),
+        ))
+        mock_session.commit = AsyncMock(side_effect=Exception("DB Connection Lost"))
 
-            response = await client.post(
+        async def failing_get_db():
+            yield mock_session
+
+        app.dependency_overrides[get_db] = failing_get_db
+
+        # The shared client re-raises app errors; this one returns them as a 500
+        transport = ASGITransport(app=app, raise_app_exceptions=False)
+        async with AsyncClient(transport=transport, base_url="http://test") as ac:
+            response = await ac.post(
                 "/api/urls",
                 json={"original_url": "https://example.com/fail"},
                 headers=auth_headers,
             )
 
-            assert response.status_code == 500
+        assert response.status_code == 500
+        mock_session.commit.assert_awaited_once()
+
 
 class TestGetURLInfoEndpoint:
     """Tests for GET /api/urls/{short_code} endpoint."""
 
     @pytest.mark.asyncio
-    async def test_get_url_info(self, client, sample_url, auth_headers):
+    async def test_get_url_info(self, client, sample_url, auth_headers, mocks):
         """Can get URL info for existing URL."""
-        with patch("app.routes.get_click_count", new_callable=AsyncMock) as mock_clicks:
-            mock_clicks.return_value = 42
+        mocks.get_click_count.return_value = 42
 
-            response = await client.get(
-                f"/api/urls/{sample_url.short_code}",
-                headers=auth_headers,
-            )
+        response = await client.get(
+            f"/api/urls/{sample_url.short_code}",
+            headers=auth_headers,
+        )
 
         assert response.status_code == 200
         data = response.json()
@@ -184,24 +214,22 @@ class TestGetURLInfoEndpoint:
         assert data["is_owner"] is True
 
     @pytest.mark.asyncio
-    async def test_get_url_info_not_owner(self, client, sample_url, another_auth_headers):
+    async def test_get_url_info_not_owner(self, client, sample_url, another_auth_headers, mocks):
         """Non-owner can see URL info but is_owner is False."""
-        with patch("app.routes.get_click_count", new_callable=AsyncMock) as mock_clicks:
-            mock_clicks.return_value = 10
+        mocks.get_click_count.return_value = 10
 
-            response = await client.get(
-                f"/api/urls/{sample_url.short_code}",
-                headers=another_auth_headers,
-            )
+        response = await client.get(
+            f"/api/urls/{sample_url.short_code}",
+            headers=another_auth_headers,
+        )
 
         assert response.status_code == 200
         data = response.json()
         assert data["is_owner"] is False
 
-    @pytest.mark.asyncio
-    async def test_get_url_info_not_found(self, client, auth_headers):
+    def test_get_url_info_not_found(self, sync_client, auth_headers):
         """Returns 404 for non-existent URL."""
-        response = await client.get(
+        response = sync_client.get(
             "/api/urls/nonexist",
             headers=auth_headers,
         )
@@ -209,17 +237,19 @@ class TestGetURLInfoEndpoint:
         assert response.status_code == 404
 
     @pytest.mark.asyncio
-    async def test_get_url_info_expired(self, client, expired_url, auth_headers):
+    async def test_get_url_info_expired(self, client, expiring_url, after_expiry, auth_headers):
         """Returns 410 for expired URL."""
-        response = await client.get(
-            f"/api/urls/{expired_url.short_code}",
-            headers=auth_headers,
-        )
+        with time_machine.travel(after_expiry):
+            response = await client.get(
+                f"/api/urls/{expiring_url.short_code}",
+                headers=auth_headers,
+            )
 
         assert response.status_code == 410
         assert "expired" in response.json()["detail"].lower()
 
 
+@pytest.mark.xdist_group("db_write")
 class TestDeleteURLEndpoint:
     """Tests for DELETE /api/urls/{short_code} endpoint."""
 
@@ -265,70 +295,104 @@ class TestRedirectEndpoint:
     """Tests for GET /{short_code} redirect endpoint."""
 
     @pytest.mark.asyncio
-    async def test_redirect_success(self, client, sample_url):
+    async def test_redirect_success(self, client, sample_url, mocks):
         """Redirect returns 307 to original URL."""
-        with patch("app.routes.track_click", new_callable=AsyncMock):
-            response = await client.get(
-                f"/{sample_url.short_code}",
-                follow_redirects=False,
-            )
+        response = await client.get(
+            f"/{sample_url.short_code}",
+            follow_redirects=False,
+        )
 
         assert response.status_code == 307
         assert response.headers["location"] == sample_url.original_url
+        mocks.track_click.assert_awaited_once_with(
+            sample_url.short_code, sample_url.original_url
+        )
 
     @pytest.mark.asyncio
-    async def test_redirect_not_found(self, client):
-        """Returns 404 for non-existent short code."""
-        response = await client.get("/nonexist", follow_redirects=False)
+    @pytest.mark.parametrize(
+        "short_code, expected_status",
+        [("nonexist", 404), ("exprd1", 410)],
+        ids=["not_found", "expired"],
+    )
+    async def test_redirect_error(self, client, urls_bundle, mocks, short_code, expected_status):
+        """Missing codes return 404 and expired ones 410, without tracking a click."""
+        response = await client.get(f"/{short_code}", follow_redirects=False)
 
-        assert response.status_code == 404
+        assert response.status_code == expected_status
+        mocks.track_click.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_redirect_expired_url(self, client, expired_url):
-        """Returns 410 for expired URL."""
-        response = await client.get(
-            f"/{expired_url.short_code}",
-            follow_redirects=False,
+    async def test_redirect_until_expiry(self, client, expiring_url, after_expiry):
+        """A URL redirects until its expiry passes, then returns 410."""
+        response = await client.get(f"/{expiring_url.short_code}", follow_redirects=False)
+        assert response.status_code == 307
+
+        with time_machine.travel(after_expiry):
+            response = await client.get(f"/{expiring_url.short_code}", follow_redirects=False)
+        assert response.status_code == 410
+
+    @pytest.mark.asyncio
+    async def test_redirect_cached_expired(self, client_with_cache, monkeypatch, mocks):
+        """A cache hit past its expiry returns 410 without tracking a click."""
+        monkeypatch.setattr(
+            "app.routes.get_cached_url",
+            AsyncMock(return_value={
+                "original_url": "https://example.com/stale",
+                "exp_ts": int(time.time()) - 60,
+            }),
         )
 
+        response = await client_with_cache.get("/cachedx", follow_redirects=False)
+
         assert response.status_code == 410
+        mocks.track_click.assert_not_called()
 
 
+@pytest.mark.xdist_group("db_write")
 class TestListURLsEndpoint:
     """Tests for GET /api/urls endpoint."""
 
     @pytest.mark.asyncio
-    async def test_list_urls_authenticated(self, client, sample_url, auth_headers):
-        """Authenticated user can list their URLs."""
+    @pytest.mark.parametrize(
+        "query, max_items",
+        [("", 100), ("?skip=0&limit=10", 10)],
+        ids=["default", "paginated"],
+    )
+    async def test_list_urls_authenticated(self, client, sample_url, auth_headers, query, max_items):
+        """Authenticated user can list their URLs, optionally paginated."""
         response = await client.get(
-            "/api/urls",
+            f"/api/urls{query}",
             headers=auth_headers,
         )
 
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
-        assert len(data) >= 1
+        assert 1 <= len(data) <= max_items
         assert any(url["short_code"] == sample_url.short_code for url in data)
 
     @pytest.mark.asyncio
-    async def test_list_urls_not_authenticated(self, client):
+    async def test_list_urls_not_authenticated(self, validation_client):
         """Unauthenticated user cannot list URLs."""
-        response = await client.get("/api/urls")
+        response = await validation_client.get("/api/urls")
 
         assert response.status_code == 401
 
     @pytest.mark.asyncio
-    async def test_list_urls_pagination(self, client, auth_headers, sample_url):
-        """Can paginate URL list."""
+    async def test_list_urls_only_own(self, client, auth_headers, urls_bundle):
+        """Lists every URL the user owns and none of the guest URLs."""
         response = await client.get(
-            "/api/urls?skip=0&limit=10",
+            "/api/urls",
             headers=auth_headers,
         )
 
         assert response.status_code == 200
-        data = response.json()
-        assert len(data) <= 10
+        codes = {url["short_code"] for url in response.json()}
+        assert codes == {
+            urls_bundle.sample.short_code,
+            urls_bundle.expired.short_code,
+            urls_bundle.future.short_code,
+        }
 
     @pytest.mark.asyncio
     async def test_list_urls_empty(self, client, another_auth_headers):
@@ -343,6 +407,7 @@ class TestListURLsEndpoint:
         assert data == []
 
 
+@pytest.mark.xdist_group("db_write")
 class TestClaimURLsEndpoint:
     """Tests for POST /api/urls/claim endpoint."""
 
@@ -359,6 +424,8 @@ class TestClaimURLsEndpoint:
         data = response.json()
         assert data["claimed"] >= 1
         assert "successfully claimed" in data["message"].lower()
+        # The client fixture swaps the cache helpers in app.routes for mocks
+        routes.invalidate_urls.assert_awaited_once_with([guest_url.short_code])
 
     @pytest.mark.asyncio
     async def test_claim_urls_invalid_token(self, client, auth_headers):
@@ -374,9 +441,9 @@ class TestClaimURLsEndpoint:
         assert data["claimed"] == 0
 
     @pytest.mark.asyncio
-    async def test_claim_urls_not_authenticated(self, client, guest_claim_token):
+    async def test_claim_urls_not_authenticated(self, validation_client, guest_claim_token):
         """Unauthenticated user cannot claim URLs."""
-        response = await client.post(
+        response = await validation_client.post(
             "/api/urls/claim",
             json={"claim_token": guest_claim_token},
         )
@@ -388,38 +455,63 @@ class TestQRCodeEndpoint:
     """Tests for GET /api/urls/{short_code}/qr endpoint."""
 
     @pytest.mark.asyncio
-    async def test_generate_qr_code(self, client, sample_url):
+    @pytest.mark.parametrize(
+        "query, size",
+        [("", 200), ("?size=300", 300)],
+        ids=["default_size", "custom_size"],
+    )
+    async def test_generate_qr_code(self, client, sample_url, mocks, query, size):
         """Can generate QR code for existing URL."""
-        response = await client.get(f"/api/urls/{sample_url.short_code}/qr")
+        response = await client.get(f"/api/urls/{sample_url.short_code}/qr{query}")
 
         assert response.status_code == 200
         assert response.headers["content-type"] == "image/png"
+        assert response.content == mocks.render_qr_png.return_value
+        mocks.render_qr_png.assert_called_once_with(
+            f"{SHORT_URL_PREFIX}{sample_url.short_code}", size
+        )
 
     @pytest.mark.asyncio
-    async def test_qr_code_custom_size(self, client, sample_url):
-        """Can generate QR code with custom size."""
-        response = await client.get(f"/api/urls/{sample_url.short_code}/qr?size=300")
+    async def test_qr_code_cached(self, validation_client, monkeypatch, mocks):
+        """A cached image is returned without a database lookup or re-rendering."""
+        cached_png = b"\x89PNG cached"
+        get_cached_qr = AsyncMock(return_value=cached_png)
+        monkeypatch.setattr("app.routes.get_cached_qr", get_cached_qr)
+
+        response = await validation_client.get("/api/urls/cached1/qr?size=300")
 
         assert response.status_code == 200
+        assert response.content == cached_png
+        get_cached_qr.assert_awaited_once_with("cached1", 300)
+        mocks.render_qr_png.assert_not_called()
+
+    def test_render_qr_png(self):
+        """The real renderer produces a PNG of the requested size."""
+        png = render_qr_png("https://example.com/abc123", 300)
+
+        with Image.open(io.BytesIO(png)) as image:
+            assert image.format == "PNG"
+            assert image.size == (300, 300)
 
     @pytest.mark.asyncio
-    async def test_qr_code_invalid_size(self, client, sample_url):
+    @pytest.mark.parametrize("size", [50, 1001])
+    async def test_qr_code_invalid_size(self, validation_client, size):
         """Returns 400 for invalid QR code size."""
-        response = await client.get(f"/api/urls/{sample_url.short_code}/qr?size=50")
+        response = await validation_client.get(f"/api/urls/test123/qr?size={size}")
 
         assert response.status_code == 400
 
-    @pytest.mark.asyncio
-    async def test_qr_code_not_found(self, client):
+    def test_qr_code_not_found(self, sync_client):
         """Returns 404 for non-existent URL."""
-        response = await client.get("/api/urls/nonexist/qr")
+        response = sync_client.get("/api/urls/nonexist/qr")
 
         assert response.status_code == 404
 
     @pytest.mark.asyncio
-    async def test_qr_code_expired_url(self, client, expired_url):
+    async def test_qr_code_expired_url(self, client, expiring_url, after_expiry):
         """Returns 410 for expired URL."""
-        response = await client.get(f"/api/urls/{expired_url.short_code}/qr")
+        with time_machine.travel(after_expiry):
+            response = await client.get(f"/api/urls/{expiring_url.short_code}/qr")
 
         assert response.status_code == 410
 
@@ -428,45 +520,65 @@ class TestAuthenticationErrors:
     """Tests for authentication error handling."""
 
     @pytest.mark.asyncio
-    async def test_expired_token(self, client, expired_token):
-        """Expired token returns 401."""
-        response = await client.get(
+    @pytest.mark.parametrize(
+        "authorization, expected_detail",
+        [
+            ("Bearer {expired_token}", "expired"),
+            ("Bearer {invalid_token}", "invalid"),
+            ("NotBearer token", None),
+        ],
+        ids=["expired_token", "invalid_token", "malformed_header"],
+    )
+    async def test_rejected_credentials(
+        self, validation_client, expired_token, invalid_token, authorization, expected_detail
+    ):
+        """Expired, invalid or malformed credentials return 401."""
+        response = await validation_client.get(
             "/api/urls",
-            headers={"Authorization": f"Bearer {expired_token}"},
-        )
-
-        assert response.status_code == 401
-        assert "expired" in response.json()["detail"].lower()
-
-    @pytest.mark.asyncio
-    async def test_invalid_token(self, client, invalid_token):
-        """Invalid token returns 401."""
-        response = await client.get(
-            "/api/urls",
-            headers={"Authorization": f"Bearer {invalid_token}"},
+            headers={
+                "Authorization": authorization.format(
+                    expired_token=expired_token, invalid_token=invalid_token
+                )
+            },
         )
 
         assert response.status_code == 401
-        assert "invalid" in response.json()["detail"].lower()
-
-    @pytest.mark.asyncio
-    async def test_malformed_auth_header(self, client):
-        """Malformed auth header returns 401."""
-        response = await client.get(
-            "/api/urls",
-            headers={"Authorization": "NotBearer token"},
-        )
-        assert response.status_code == 401
+        if expected_detail is not None:
+            assert expected_detail in response.json()["detail"].lower()
 
 
 class TestMetricsEndpoint:
     """Tests for /metrics endpoint."""
 
-    @pytest.mark.asyncio
-    async def test_metrics_endpoint(self, client):
+    def test_metrics_endpoint(self, sync_client):
         """Metrics endpoint returns Prometheus metrics."""
-        response = await client.get("/metrics")
+        response = sync_client.get("/metrics")
 
         assert response.status_code == 200
         assert "text/plain" in response.headers["content-type"] or \
                "text/plain; version=0.0.4" in response.headers.get("content-type", "")
+
+    @pytest.mark.parametrize("accept_encoding", ["identity", "gzip;q=0"])
+    def test_metrics_uncompressed(self, sync_client, monkeypatch, accept_encoding):
+        """Clients that don't accept gzip get a plain body."""
+        monkeypatch.setattr("app.main._metrics_cache", (0.0, b"", None))
+        monkeypatch.setattr("app.main.generate_latest", MagicMock(return_value=b"up 1\n"))
+
+        response = sync_client.get("/metrics", headers={"Accept-Encoding": accept_encoding})
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.content == b"up 1\n"
+
+    def test_metrics_snapshot_reused(self, sync_client, monkeypatch):
+        """Scrapes within METRICS_CACHE_SECONDS share one generated snapshot."""
+        monkeypatch.setattr("app.main._metrics_cache", (0.0, b"", None))
+        generate_latest = MagicMock(return_value=b"up 1\n")
+        monkeypatch.setattr("app.main.generate_latest", generate_latest)
+
+        first = sync_client.get("/metrics")
+        second = sync_client.get("/metrics", headers={"Accept-Encoding": "identity"})
+
+        assert first.headers["content-encoding"] == "gzip"
+        assert first.content == second.content == b"up 1\n"
+        generate_latest.assert_called_once()
@@ -1,5 +1,5 @@
 import pytest
-from app.utils import generate_short_code, is_valid_short_code, validate_url
+from app.utils import ALPHABET, generate_short_code, is_valid_short_code, validate_url
 
 
 class TestShortCodeGeneration:
@@ -13,43 +13,74 @@ class TestShortCodeGeneration:
         assert len(code) == 10
         assert code.isalnum()
 
-    def test_generate_short_code_uniqueness(self):
-        codes = [generate_short_code(6) for _ in range(100)]
-        assert len(set(codes)) == len(codes)
+    def test_generate_short_code_uniqueness(self, generated_short_codes):
+        assert len(set(generated_short_codes)) == len(generated_short_codes)
 
+    def test_generated_short_codes_are_valid(self, generated_short_codes):
+        assert all(is_valid_short_code(code) for code in generated_short_codes)
 
-class TestShortCodeValidation:
-    def test_valid_short_code(self):
-        assert is_valid_short_code("abc123") is True
-        assert is_valid_short_code("ABC") is True
-        assert is_valid_short_code("a1b2c3d4e5") is True
-
-    def test_invalid_short_code_too_short(self):
-        assert is_valid_short_code("ab") is False
-        assert is_valid_short_code("a") is False
+    def test_generate_short_code_uses_whole_alphabet(self):
+        # 5000 draws from 62 symbols; missing any one by chance is ~1e-33
+        chars = set(generate_short_code(5000))
+        assert chars == set(ALPHABET)
 
-    def test_invalid_short_code_too_long(self):
-        assert is_valid_short_code("a" * 11) is False
 
-    def test_invalid_short_code_special_chars(self):
-        assert is_valid_short_code("abc-123") is False
-        assert is_valid_short_code("abc_123") is False
-        assert is_valid_short_code("abc 123") is False
+class TestShortCodeValidation:
+    @pytest.mark.parametrize(
+        "code, expected",
+        [
+            ("abc123", True),
+            ("ABC", True),
+            ("a1b2c3d4e5", True),
+            # too short
+            ("ab", False),
+            ("a", False),
+            # too long
+            ("a" * 11, False),
+            # special characters
+            ("abc-123", False),
+            ("abc_123", False),
+            ("abc 123", False),
+        ],
+    )
+    def test_is_valid_short_code(self, code, expected):
+        assert is_valid_short_code(code) is expected
 
 
 class TestURLValidation:
-    def test_valid_urls(self):
-        assert validate_url("https://google.com") is True
-        assert validate_url("http://example.com/path") is True
-        assert validate_url("https://sub.domain.com/path?query=1") is True
-        assert validate_url("http://localhost:3000") is True
-
-    def test_invalid_urls(self):
-        assert validate_url("not-a-url") is False
-        assert validate_url("ftp://example.com") is False
-        assert validate_url("") is False
-
-    def test_url_with_whitespace(self):
-        """Validator should reject or handle URLs with leading/trailing whitespace."""
-        assert validate_url("  https://google.com  ") is False        
-        assert validate_url("https://goo gle.com") is False
\ No newline at end of file
+    @pytest.mark.parametrize(
+        "url, expected",
+        [
+            ("https://google.com", True),
+            ("http://example.com/path", True),
+            ("https://sub.domain.com/path?query=1", True),
+            ("http://localhost:3000", True),
+            ("not-a-url", False),
+            ("ftp://example.com", False),
+            ("", False),
+            # leading/trailing or embedded whitespace
+            ("  https://google.com  ", False),
+            ("https://goo gle.com", False),
+            # trailing newline
+            ("https://google.com\n", False),
+            ("https://google.com/path\n", False),
+        ],
+    )
+    def test_validate_url(self, url, expected):
+        assert validate_url(url) is expected
+
+    def test_overlong_url_rejected(self):
+        assert validate_url("https://example.com/" + "a" * 2048) is False
+
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "http://a." + "a" * 2000,
+            "http://" + "a." * 1000 + "!",
+            "http://example.com/" + "a" * 2000 + " x",
+            "http://example.com:" + "1" * 2000 + "x",
+        ],
+        ids=["long_tld", "many_labels", "space_after_long_path", "long_port"],
+    )
+    def test_long_invalid_url_rejected(self, url):
+        assert validate_url(url) is False